@@ -8,102 +8,275 @@ GPU检测和uv sync命令生成工具
 """
 
 import argparse
+import json
+import os
+import pathlib
+import select
 import subprocess
 import sys
 import re
+import time
 from typing import Optional, Tuple
 
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+
+
+# 终端是UTF编码时才输出emoji前缀，legacy locale下输出纯ASCII，
+# 避免print走逐码点编码慢路径甚至直接抛编码错误
+_EMOJI = bool(sys.stdout.encoding and sys.stdout.encoding.lower().startswith("utf"))
+
+
+def _icon(emoji: str) -> str:
+    """返回带空格的emoji前缀，非UTF终端时返回空串"""
+    return emoji + " " if _EMOJI else ""
+
+
+# 检测结果缓存: 以NVIDIA驱动版本文件的mtime作为失效依据，驱动升级后自动重新检测；
+# 驱动版本文件不存在时（如WSL2不暴露该伪文件）退化为按TTL失效
+_CACHE_PATH = pathlib.Path.home() / ".cache" / "gpu_sync" / "gpu.json"
+_DRIVER_VERSION_FILE = pathlib.Path("/proc/driver/nvidia/version")
+_CACHE_TTL = 24 * 3600
+
+
+def _read_gpu_cache() -> Optional[str]:
+    """读取缓存的GPU名称，缓存缺失、过期或损坏时返回None"""
+    try:
+        cache_mtime = _CACHE_PATH.stat().st_mtime
+        try:
+            stale_before = _DRIVER_VERSION_FILE.stat().st_mtime
+        except OSError:
+            # 无驱动版本文件可比对，退化为TTL
+            stale_before = time.time() - _CACHE_TTL
+        if cache_mtime <= stale_before:
+            return None
+        data = json.loads(_CACHE_PATH.read_text())
+        return data.get("name") if isinstance(data, dict) else None
+    except (OSError, ValueError):
+        return None
+
+
+def _write_gpu_cache(name: str) -> None:
+    """写入GPU名称缓存，失败时静默忽略（缓存只是优化）"""
+    try:
+        _CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _CACHE_PATH.write_text(json.dumps({"name": name, "ts": time.time()}))
+    except OSError:
+        pass
+
+
+class _GPUProbe:
+    """
+    常驻NVML探针
+
+    __enter__只做一次nvmlInit；设备句柄在首次查询成功时缓存，
+    GPU尚未就绪时可在同一会话内反复重试，不会泄漏NVML初始化计数。
+    """
+
+    def __enter__(self) -> "_GPUProbe":
+        pynvml.nvmlInit()
+        self._handle = None
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        pynvml.nvmlShutdown()
+
+    def name(self) -> Optional[str]:
+        """返回GPU名称，GPU尚未就绪时返回None（句柄获取成功后缓存复用）"""
+        try:
+            if self._handle is None:
+                self._handle = pynvml.nvmlDeviceGetHandleByIndex(0)
+            name = pynvml.nvmlDeviceGetName(self._handle)
+        except pynvml.NVMLError:
+            # 句柄可能已失效（如GPU掉线），下次查询重新获取
+            self._handle = None
+            return None
+        if isinstance(name, bytes):
+            name = name.decode("utf-8", "replace")
+        return name
+
+
+def watch_gpu(interval: float = 1.0) -> Optional[str]:
+    """
+    等待GPU就绪（--watch模式）
+
+    通过NVML轮询直到检测到GPU，返回GPU名称。NVML会话和设备句柄在
+    轮询期间复用，相比fork-per-poll的nvidia-smi循环CPU开销可以忽略。
+
+    Args:
+        interval: 轮询间隔（秒）
+
+    Returns:
+        GPU型号字符串，pynvml不可用时返回None
+    """
+    if pynvml is None:
+        print("警告: --watch模式需要pynvml，回退到单次检测")
+        return get_gpu_info()
+    while True:
+        try:
+            with _GPUProbe() as probe:
+                # 同一NVML会话内轮询，句柄获取失败只是GPU未就绪
+                while True:
+                    name = probe.name()
+                    if name:
+                        return name
+                    time.sleep(interval)
+        except pynvml.NVMLError:
+            # nvmlInit失败（驱动尚未加载），稍后重试初始化
+            time.sleep(interval)
+
+
+def _get_gpu_info_procfs() -> Optional[str]:
+    """
+    从/proc/driver/nvidia/gpus/*/information读取GPU型号（仅Linux）
+
+    读取~200字节的伪文件只需微秒级时间，远快于NVML初始化或nvidia-smi子进程，
+    且不依赖GPU persistence mode。
+
+    Returns:
+        GPU型号字符串，非Linux或驱动未加载时返回None
+    """
+    if sys.platform != "linux":
+        return None
+    try:
+        for info_file in pathlib.Path("/proc/driver/nvidia/gpus").glob("*/information"):
+            for line in info_file.read_text().splitlines():
+                if line.startswith("Model:"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return None
+
+
+def _get_gpu_info_nvml() -> Optional[str]:
+    """
+    通过NVML库直接查询GPU名称
+
+    相比fork一个nvidia-smi子进程（约100-600ms），NVML调用只需几毫秒。
+
+    Returns:
+        GPU型号字符串，如果pynvml不可用或查询失败则返回None
+    """
+    if pynvml is None:
+        return None
+    try:
+        pynvml.nvmlInit()
+        try:
+            handle = pynvml.nvmlDeviceGetHandleByIndex(0)
+            name = pynvml.nvmlDeviceGetName(handle)
+            if isinstance(name, bytes):
+                name = name.decode("utf-8", "replace")
+            return name
+        finally:
+            pynvml.nvmlShutdown()
+    except pynvml.NVMLError:
+        return None
+
 
 def get_gpu_info() -> Optional[str]:
     """
     获取GPU信息
-    
+
+    按开销从低到高依次尝试: 缓存 → /proc伪文件 → NVML → nvidia-smi子进程。
+    检测成功后结果写入缓存，驱动升级时自动失效。
+
     Returns:
         GPU型号字符串，如果检测失败则返回None
     """
+    # 缓存命中时直接返回，免去每次调用的检测开销
+    gpu_name = _read_gpu_cache()
+    if gpu_name:
+        return gpu_name
+
+    # Linux下直接读驱动伪文件，微秒级
+    gpu_name = _get_gpu_info_procfs()
+    if gpu_name:
+        _write_gpu_cache(gpu_name)
+        return gpu_name
+
+    # 其次尝试NVML，避免子进程开销
+    gpu_name = _get_gpu_info_nvml()
+    if gpu_name:
+        _write_gpu_cache(gpu_name)
+        return gpu_name
+
     try:
-        # 尝试使用nvidia-smi获取GPU信息
+        # 回退: 使用nvidia-smi获取GPU信息
+        # 不用text=True: GPU名称是纯ASCII，跳过locale相关的整体解码，
+        # 只在取出第一行后做一次ASCII解码
         result = subprocess.run(
             ["nvidia-smi", "--query-gpu=name", "--format=csv,noheader,nounits"],
             capture_output=True,
-            text=True,
             check=True
         )
-        gpu_names = result.stdout.strip().split('\n')
-        return gpu_names[0] if gpu_names else None
+        gpu_lines = result.stdout.splitlines()
+        gpu_name = gpu_lines[0].decode("ascii", "replace").strip() if gpu_lines else None
+        if gpu_name:
+            _write_gpu_cache(gpu_name)
+        return gpu_name
     except (subprocess.CalledProcessError, FileNotFoundError):
         print("警告: 无法检测到NVIDIA GPU或nvidia-smi不可用")
         return None
 
 
+# 支持的型号集中在一个元组里，新增GPU只需在这里加一项
+_GPU_MODELS = ("5090", "4090", "3090", "2080")
+
+# 由型号表生成单个正则，一次编译、一次扫描即可提取型号，
+# 避免每次调用做 N 次 lower()+子串匹配（匹配仍是对输入的单趟扫描）
+_GPU_RE = re.compile(r'rtx\s*(' + '|'.join(_GPU_MODELS) + r')', re.IGNORECASE)
+
+
 def parse_gpu_model(gpu_name: str) -> str:
     """
     解析GPU型号并返回对应的依赖组名称
-    
+
     Args:
         gpu_name: GPU名称字符串
-        
+
     Returns:
-        对应的依赖组名称
+        对应的依赖组名称，未识别的GPU默认使用rtx4090配置（稳定版本）
     """
-    gpu_name_lower = gpu_name.lower()
-    
-    # RTX 5090系列 - 使用nightly版本
-    if "rtx 5090" in gpu_name_lower or "geforce rtx 5090" in gpu_name_lower:
-        return "rtx5090"
-    
-    # RTX 4090系列
-    elif "rtx 4090" in gpu_name_lower or "geforce rtx 4090" in gpu_name_lower:
-        return "rtx4090"
-    
-    # RTX 3090系列
-    elif "rtx 3090" in gpu_name_lower or "geforce rtx 3090" in gpu_name_lower:
-        return "rtx3090"
-    
-    # RTX 2080系列
-    elif "rtx 2080" in gpu_name_lower or "geforce rtx 2080" in gpu_name_lower:
-        return "rtx2080"
-    
-    # 其他GPU默认使用rtx4090配置（稳定版本）
-    else:
-        return "rtx4090"
+    m = _GPU_RE.search(gpu_name)
+    return f"rtx{m.group(1)}" if m else "rtx4090"
 
 
-def get_uv_sync_command(gpu_group: str) -> Tuple[str, str]:
+# GPU组 → (uv sync命令, 描述) 查找表，O(1)哈希查找代替逐个字符串比较
+# 命令在模块加载时就已拆分好，执行时无需再split，也杜绝了引号解析问题
+_UV_SYNC_TABLE = {
+    "rtx5090": (
+        ("uv", "sync", "--group", "rtx5090"),
+        "RTX 5090 - 使用最新的nightly PyTorch版本，支持最新的CUDA特性"
+    ),
+    "rtx4090": (
+        ("uv", "sync", "--group", "rtx4090"),
+        "RTX 4090 - 使用稳定版本的PyTorch"
+    ),
+    "rtx3090": (
+        ("uv", "sync", "--group", "rtx3090"),
+        "RTX 3090 - 使用稳定版本的PyTorch"
+    ),
+    "rtx2080": (
+        ("uv", "sync", "--group", "rtx2080"),
+        "RTX 2080 - 使用稳定版本的PyTorch"
+    ),
+}
+_DEFAULT_SYNC = (("uv", "sync"), "默认配置 - 使用基础依赖")
+
+
+def get_uv_sync_command(gpu_group: str) -> Tuple[Tuple[str, ...], str]:
     """
     根据GPU组获取对应的uv sync命令
-    
+
     Args:
         gpu_group: GPU依赖组名称
-        
+
     Returns:
-        (uv_sync_command, description)
+        (uv_sync_command_argv, description)
     """
-    if gpu_group == "rtx5090":
-        return (
-            "uv sync --group rtx5090",
-            "RTX 5090 - 使用最新的nightly PyTorch版本，支持最新的CUDA特性"
-        )
-    elif gpu_group == "rtx4090":
-        return (
-            "uv sync --group rtx4090", 
-            "RTX 4090 - 使用稳定版本的PyTorch"
-        )
-    elif gpu_group == "rtx3090":
-        return (
-            "uv sync --group rtx3090",
-            "RTX 3090 - 使用稳定版本的PyTorch"
-        )
-    elif gpu_group == "rtx2080":
-        return (
-            "uv sync --group rtx2080",
-            "RTX 2080 - 使用稳定版本的PyTorch"
-        )
-    else:
-        return (
-            "uv sync",
-            "默认配置 - 使用基础依赖"
-        )
+    return _UV_SYNC_TABLE.get(gpu_group, _DEFAULT_SYNC)
 
 
 def parse_arguments():
@@ -118,6 +291,7 @@ def parse_arguments():
   %(prog)s --gpu rtx5090      # 强制使用指定GPU配置
   %(prog)s --list-gpus        # 列出支持的GPU配置
   %(prog)s --dry-run          # 只显示命令，不执行
+  %(prog)s --watch            # 等待GPU就绪后再检测
         """
     )
     
@@ -144,19 +318,50 @@ def parse_arguments():
         action="store_true",
         help="列出所有支持的GPU配置"
     )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="通过NVML轮询等待GPU就绪后再检测（需要pynvml）"
+    )
     
     return parser.parse_args()
 
 
 def list_supported_gpus():
-    """列出支持的GPU配置"""
-    print("🎯 支持的GPU配置:")
-    print("  rtx5090 - RTX 5090 (最新nightly PyTorch版本)")
-    print("  rtx4090 - RTX 4090 (稳定版本)")
-    print("  rtx3090 - RTX 3090 (稳定版本)")
-    print("  rtx2080 - RTX 2080 (稳定版本)")
-    print("\n💡 使用方法:")
-    print("  python3 gpu_sync.py --gpu rtx5090")
+    """列出支持的GPU配置（单次write输出，减少stdout锁/刷新次数）"""
+    sys.stdout.write(
+        f"{_icon('🎯')}支持的GPU配置:\n"
+        "  rtx5090 - RTX 5090 (最新nightly PyTorch版本)\n"
+        "  rtx4090 - RTX 4090 (稳定版本)\n"
+        "  rtx3090 - RTX 3090 (稳定版本)\n"
+        "  rtx2080 - RTX 2080 (稳定版本)\n"
+        f"\n{_icon('💡')}使用方法:\n"
+        "  python3 gpu_sync.py --gpu rtx5090\n"
+    )
+
+
+def _prompt_confirm(prompt: str, timeout: float = 10.0) -> str:
+    """
+    带超时的确认提示
+
+    使用select做有界等待，超时后返回空串（视为否），
+    避免input()在无人值守的管道/CI中无限阻塞。
+
+    Args:
+        prompt: 提示文本
+        timeout: 等待用户输入的秒数
+
+    Returns:
+        用户输入（已strip并转小写），超时则返回空串
+    """
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    readable, _, _ = select.select([sys.stdin], [], [], timeout)
+    if not readable:
+        sys.stdout.write("\n")
+        return ""
+    return sys.stdin.readline().strip().lower()
 
 
 def main():
@@ -168,50 +373,59 @@ def main():
         list_supported_gpus()
         return
     
-    print("🔍 正在检测GPU信息...")
+    print(f"{_icon('🔍')}正在检测GPU信息...")
     
     # 如果用户指定了GPU类型，跳过检测
     if args.gpu:
         gpu_group = args.gpu
         command, description = get_uv_sync_command(gpu_group)
-        print(f"✅ 使用指定GPU配置: {args.gpu.upper()}")
+        print(f"{_icon('✅')}使用指定GPU配置: {args.gpu.upper()}")
     else:
-        # 检测GPU
-        gpu_name = get_gpu_info()
+        # 检测GPU（--watch模式下轮询等待GPU就绪）
+        gpu_name = watch_gpu() if args.watch else get_gpu_info()
         
         if gpu_name:
-            print(f"✅ 检测到GPU: {gpu_name}")
+            print(f"{_icon('✅')}检测到GPU: {gpu_name}")
             gpu_group = parse_gpu_model(gpu_name)
             command, description = get_uv_sync_command(gpu_group)
         else:
-            print("❌ 无法检测到GPU，将使用默认配置")
-            command, description = "uv sync", "默认配置 - 使用基础依赖"
-    
-    print(f"\n📦 推荐的依赖配置: {description}")
-    print(f"🚀 执行以下命令同步依赖:")
-    print(f"   {command}")
+            print(f"{_icon('❌')}无法检测到GPU，将使用默认配置")
+            command, description = _DEFAULT_SYNC
+
+    display_command = " ".join(command)
+    print(f"\n{_icon('📦')}推荐的依赖配置: {description}")
+    print(f"{_icon('🚀')}执行以下命令同步依赖:")
+    print(f"   {display_command}")
     
     # 如果是dry-run模式，只显示命令不执行
     if args.dry_run:
-        print("\n💡 这是dry-run模式，命令未实际执行")
+        print(f"\n{_icon('💡')}这是dry-run模式，命令未实际执行")
         return
     
     # 询问是否立即执行（除非是auto模式）
     should_execute = args.auto
     if not args.auto:
-        response = input(f"\n是否立即执行此命令? (y/N): ").strip().lower()
+        response = _prompt_confirm(f"\n是否立即执行此命令? (y/N, 10秒后默认N): ")
         should_execute = response in ['y', 'yes', '是']
     
     if should_execute:
-        print(f"\n⚡ 正在执行: {command}")
+        print(f"\n{_icon('⚡')}正在执行: {display_command}")
         try:
-            subprocess.run(command.split(), check=True)
-            print("✅ 依赖同步完成!")
-        except subprocess.CalledProcessError as e:
-            print(f"❌ 命令执行失败: {e}")
-            sys.exit(1)
+            # exec前先刷新stdout: 进程被替换后Python的块缓冲不会再flush，
+            # 否则stdout是管道时前面的输出会全部丢失
+            sys.stdout.flush()
+            # 直接用uv进程替换当前进程: 少一次fork，Ctrl-C等信号由uv自己处理
+            os.execvp(command[0], command)
+        except OSError:
+            # exec失败时回退到子进程执行
+            try:
+                subprocess.run(command, check=True)
+                print(f"{_icon('✅')}依赖同步完成!")
+            except subprocess.CalledProcessError as e:
+                print(f"{_icon('❌')}命令执行失败: {e}")
+                sys.exit(1)
     else:
-        print("💡 您可以手动执行上面的命令来同步依赖")
+        print(f"{_icon('💡')}您可以手动执行上面的命令来同步依赖")
 
 
 if __name__ == "__main__":
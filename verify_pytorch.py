@@ -7,8 +7,19 @@ PyTorch安装验证脚本
 """
 
 import argparse
+import importlib.metadata
 import sys
 
+# 终端是UTF编码时才输出emoji前缀，legacy locale下输出纯ASCII，
+# 避免print走逐码点编码慢路径甚至直接抛编码错误
+_EMOJI = bool(sys.stdout.encoding and sys.stdout.encoding.lower().startswith("utf"))
+
+
+def _icon(emoji: str) -> str:
+    """返回带空格的emoji前缀，非UTF终端时返回空串"""
+    return emoji + " " if _EMOJI else ""
+
+
 def parse_arguments():
     """解析命令行参数"""
     parser = argparse.ArgumentParser(
@@ -17,16 +28,23 @@ def parse_arguments():
         epilog="""
 示例用法:
   %(prog)s                    # 基础验证（不加载模型）
+  %(prog)s --gpu-test         # 额外执行GPU矩阵乘法测试
   %(prog)s --load-model       # 完整验证（包括加载实际模型）
   %(prog)s --model-name BAAI/bge-reranker-base  # 指定模型名称
         """
     )
-    
+
     parser.add_argument(
         "--load-model",
         action="store_true",
         help="加载实际模型进行验证（需要网络连接下载模型）"
     )
+
+    parser.add_argument(
+        "--gpu-test",
+        action="store_true",
+        help="执行GPU矩阵乘法测试（会分配显存并初始化CUDA上下文）"
+    )
     
     parser.add_argument(
         "--model-name",
@@ -37,83 +55,109 @@ def parse_arguments():
     return parser.parse_args()
 
 
-def verify_pytorch():
-    """验证PyTorch安装"""
-    print("🔍 验证PyTorch安装...")
-    
-    try:
-        import torch
-        print(f"✅ PyTorch版本: {torch.__version__}")
-        
-        # 检查CUDA可用性
-        if torch.cuda.is_available():
-            print(f"✅ CUDA可用: {torch.version.cuda}")
-            print(f"✅ CUDNN版本: {torch.backends.cudnn.version()}")
-            print(f"✅ 检测到 {torch.cuda.device_count()} 个GPU设备")
-            
-            for i in range(torch.cuda.device_count()):
-                gpu_name = torch.cuda.get_device_name(i)
-                gpu_memory = torch.cuda.get_device_properties(i).total_memory / 1024**3
-                print(f"   GPU {i}: {gpu_name} ({gpu_memory:.1f} GB)")
-                
-            # 简单的GPU测试
-            print("\n🧪 执行简单的GPU测试...")
-            x = torch.randn(1000, 1000).cuda()
-            y = torch.randn(1000, 1000).cuda()
-            z = torch.matmul(x, y)
-            print(f"✅ GPU计算测试通过: {z.shape}")
-            
-        else:
-            print("❌ CUDA不可用")
-            
-    except ImportError as e:
-        print(f"❌ PyTorch导入失败: {e}")
-        return False
-        
-    try:
-        import torchvision
-        print(f"✅ TorchVision版本: {torchvision.__version__}")
-    except ImportError:
-        print("❌ TorchVision未安装")
-        
+def verify_pytorch(gpu_test: bool = False):
+    """
+    验证PyTorch安装
+
+    Args:
+        gpu_test: 是否执行GPU矩阵乘法测试（默认不执行，避免分配显存）
+
+    Returns:
+        (verification_success, cuda_ok)
+    """
+    print(f"{_icon('🔍')}验证PyTorch安装...")
+
+    # 消息先收集到列表，函数退出时一次性write，避免几十次stdout加锁/刷新
+    lines: list[str] = []
     try:
-        import torchaudio
-        print(f"✅ TorchAudio版本: {torchaudio.__version__}")
-    except ImportError:
-        print("❌ TorchAudio未安装")
-        
-    return True
+        try:
+            import torch
+            lines.append(f"{_icon('✅')}PyTorch版本: {torch.__version__}")
+
+            # 先检查torch是否带CUDA构建，再探测驱动——CPU版torch直接短路，
+            # 避免is_available()在多GPU主机上为每个设备创建CUDA上下文
+            cuda_ok = bool(torch.version.cuda) and torch.cuda.is_available()
+            if cuda_ok:
+                device_count = torch.cuda.device_count()
+                lines.append(f"{_icon('✅')}CUDA可用: {torch.version.cuda}")
+                lines.append(f"{_icon('✅')}CUDNN版本: {torch.backends.cudnn.version()}")
+                lines.append(f"{_icon('✅')}检测到 {device_count} 个GPU设备")
+
+                for i in range(device_count):
+                    # 名称和显存都在properties里，每个设备只查询一次驱动
+                    props = torch.cuda.get_device_properties(i)
+                    gpu_memory = props.total_memory / 1024**3
+                    lines.append(f"   GPU {i}: {props.name} ({gpu_memory:.1f} GB)")
+
+                # 仅在显式要求时执行GPU测试，默认验证不分配显存
+                if gpu_test:
+                    lines.append(f"\n{_icon('🧪')}执行简单的GPU测试...")
+                    # 直接在GPU上生成张量，省去CPU分配和两次host→device拷贝
+                    x = torch.randn(1000, 1000, device='cuda')
+                    y = torch.randn(1000, 1000, device='cuda')
+                    z = x @ y
+                    # 等待kernel完成，确保报告的结果对应已完成的计算
+                    torch.cuda.synchronize()
+                    lines.append(f"{_icon('✅')}GPU计算测试通过: {z.shape}")
+
+            else:
+                lines.append(f"{_icon('❌')}CUDA不可用")
 
+        except ImportError as e:
+            lines.append(f"{_icon('❌')}PyTorch导入失败: {e}")
+            return False, False
 
-def verify_model_loading(model_name: str):
-    """验证模型加载功能"""
-    print(f"\n🤖 验证模型加载功能: {model_name}")
+        # 只需要版本号，从包元数据读取即可，无需完整import（各省~100ms）
+        try:
+            lines.append(f"{_icon('✅')}TorchVision版本: {importlib.metadata.version('torchvision')}")
+        except importlib.metadata.PackageNotFoundError:
+            lines.append(f"{_icon('❌')}TorchVision未安装")
+
+        try:
+            lines.append(f"{_icon('✅')}TorchAudio版本: {importlib.metadata.version('torchaudio')}")
+        except importlib.metadata.PackageNotFoundError:
+            lines.append(f"{_icon('❌')}TorchAudio未安装")
+
+        return True, cuda_ok
+    finally:
+        sys.stdout.write("\n".join(lines) + "\n")
+
+
+def verify_model_loading(model_name: str, cuda_ok: bool = False):
+    """
+    验证模型加载功能
+
+    Args:
+        model_name: 要加载的模型名称
+        cuda_ok: CUDA是否可用（由verify_pytorch探测，避免重复查询）
+    """
+    print(f"\n{_icon('🤖')}验证模型加载功能: {model_name}")
     
     try:
-        print("📦 正在导入sentence-transformers...")
+        print(f"{_icon('📦')}正在导入sentence-transformers...")
         from sentence_transformers import CrossEncoder
         
-        print(f"⬇️  正在加载模型: {model_name}")
+        print(f"{_icon('⬇️')} 正在加载模型: {model_name}")
         print("   (首次运行可能需要下载模型，请耐心等待...)")
         
-        model = CrossEncoder(model_name)
-        print("✅ 模型加载成功!")
+        model = CrossEncoder(model_name, device='cuda' if cuda_ok else 'cpu')
+        print(f"{_icon('✅')}模型加载成功!")
         
         # 测试模型推理
-        print("\n🧪 测试模型推理...")
+        print(f"\n{_icon('🧪')}测试模型推理...")
         test_pairs = [('如何申请信用卡？', '怎么办理信用卡？')]
         scores = model.predict(test_pairs)
-        print(f"✅ 模型推理测试通过!")
+        print(f"{_icon('✅')}模型推理测试通过!")
         print(f"   示例分数: {scores[0]:.4f}")
         
         return True
         
     except ImportError as e:
-        print(f"❌ sentence-transformers导入失败: {e}")
-        print("💡 请确保已安装sentence-transformers: pip install sentence-transformers")
+        print(f"{_icon('❌')}sentence-transformers导入失败: {e}")
+        print(f"{_icon('💡')}请确保已安装sentence-transformers: pip install sentence-transformers")
         return False
     except Exception as e:
-        print(f"❌ 模型加载或推理失败: {e}")
+        print(f"{_icon('❌')}模型加载或推理失败: {e}")
         return False
 
 
@@ -122,28 +166,28 @@ def main():
     args = parse_arguments()
     
     # 基础PyTorch验证
-    pytorch_success = verify_pytorch()
-    
+    pytorch_success, cuda_ok = verify_pytorch(gpu_test=args.gpu_test)
+
     if not pytorch_success:
-        print("\n❌ PyTorch基础验证失败")
+        print(f"\n{_icon('❌')}PyTorch基础验证失败")
         sys.exit(1)
-    
+
     # 如果用户选择加载模型验证
     model_success = True
     if args.load_model:
-        model_success = verify_model_loading(args.model_name)
+        model_success = verify_model_loading(args.model_name, cuda_ok)
     
     # 总结
     print(f"\n{'='*50}")
     if pytorch_success and model_success:
-        print("🎉 所有验证通过！")
+        print(f"{_icon('🎉')}所有验证通过！")
         if args.load_model:
-            print("✅ PyTorch环境和模型加载功能都正常工作")
+            print(f"{_icon('✅')}PyTorch环境和模型加载功能都正常工作")
         else:
-            print("✅ PyTorch环境验证完成")
-            print("💡 如需验证模型加载功能，请运行: python3 verify_pytorch.py --load-model")
+            print(f"{_icon('✅')}PyTorch环境验证完成")
+            print(f"{_icon('💡')}如需验证模型加载功能，请运行: python3 verify_pytorch.py --load-model")
     else:
-        print("❌ 验证失败")
+        print(f"{_icon('❌')}验证失败")
         sys.exit(1)
 
 if __name__ == "__main__":